@@ -1,10 +1,16 @@
-from datetime import datetime, timezone
+import atexit
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
 import requests
-import json
+from requests.adapters import HTTPAdapter, Retry
+import orjson
+import pyarrow as pa
+import simdjson
 import duckdb
 import os
-from typing import Dict, Any, Optional
-import sys
+import threading
+import time
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 import logging
 
 # Constants
@@ -12,6 +18,89 @@ INFURA_URL = "https://mainnet.infura.io/v3/"  # Add your Infura project ID here
 HEADERS = {"Content-Type": "application/json"}
 CHECKPOINT_FILE = "checkpoint.duckdb"
 MAX_SIZE_BYTES = 100 * 1024 * 1024  # 100 MB in bytes
+BATCH_SIZE = 50  # Blocks requested per JSON-RPC batch call
+FETCH_WORKERS = 4  # Number of batch calls in flight at once
+
+# Wei amounts can exceed uint64, so they are stored as 38 digit decimals
+WEI = pa.decimal128(38, 0)
+BLOCK_SCHEMA = pa.schema(
+    [
+        ("baseFeePerGas", WEI),
+        ("blobGasUsed", pa.uint64()),
+        ("difficulty", pa.uint64()),
+        ("excessBlobGas", pa.uint64()),
+        ("extraData", pa.string()),
+        ("gasLimit", pa.uint64()),
+        ("gasUsed", pa.uint64()),
+        ("hash", pa.string()),
+        ("logsBloom", pa.string()),
+        ("miner", pa.string()),
+        ("mixHash", pa.string()),
+        ("nonce", pa.uint64()),
+        ("number", pa.uint64()),
+        ("parentBeaconBlockRoot", pa.string()),
+        ("parentHash", pa.string()),
+        ("receiptsRoot", pa.string()),
+        ("sha3Uncles", pa.string()),
+        ("size", pa.uint64()),
+        ("stateRoot", pa.string()),
+        ("timestamp", pa.uint64()),
+    ]
+)
+TRANSACTION_SCHEMA = pa.schema(
+    [
+        (
+            "accessList",
+            pa.list_(
+                pa.struct(
+                    [("address", pa.string()), ("storageKeys", pa.list_(pa.string()))]
+                )
+            ),
+        ),
+        ("blockHash", pa.string()),
+        ("blockNumber", pa.uint64()),
+        ("chainId", pa.uint64()),
+        ("from", pa.string()),
+        ("gas", pa.uint64()),
+        ("gasPrice", WEI),
+        ("hash", pa.string()),
+        ("input", pa.string()),
+        ("maxFeePerGas", WEI),
+        ("maxPriorityFeePerGas", WEI),
+        ("nonce", pa.uint64()),
+        ("r", pa.string()),
+        ("s", pa.string()),
+        ("to", pa.string()),
+        ("transactionIndex", pa.uint64()),
+        ("type", pa.uint8()),
+        ("v", pa.uint64()),
+        ("value", WEI),
+        ("yParity", pa.uint8()),
+    ]
+)
+
+# Pooled connections shared by the fetch workers. Transient 5xx responses are
+# retried here, including for POST since every JSON-RPC call made is read-only.
+# 429 is left to the callers, which wait until the rate limit resets.
+session = requests.Session()
+retries = Retry(
+    total=5, backoff_factor=1, status_forcelist=[502, 503, 504], allowed_methods=None
+)
+session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=FETCH_WORKERS,
+        pool_maxsize=FETCH_WORKERS,
+        max_retries=retries,
+    ),
+)
+
+# One simdjson parser per worker thread; only one parsed document may be alive
+# per parser at a time
+_thread_local = threading.local()
+
+# Opened on first use and kept for the lifetime of the process
+_checkpoint_conn = None
 
 
 # Configure basic logging
@@ -19,28 +108,21 @@ logging.basicConfig(
     level=logging.INFO,  # Set the logging level
     format="%(asctime)s - %(levelname)s - %(message)s",  # Define output format
 )
+logger = logging.getLogger(__name__)
 
 
-def get_size(obj, seen=None):
-    """Recursively calculate the size of an object in bytes."""
-    if seen is None:
-        seen = set()
-    obj_id = id(obj)
-    if obj_id in seen:
-        return 0
-    seen.add(obj_id)
-
-    size = sys.getsizeof(obj)
-    if isinstance(obj, dict):
-        size += sum(get_size(k, seen) + get_size(v, seen) for k, v in obj.items())
-    elif isinstance(obj, (list, tuple, set)):
-        size += sum(get_size(item, seen) for item in obj)
-    return size
+def get_checkpoint_conn() -> duckdb.DuckDBPyConnection:
+    """Return the checkpoint database connection, opening it once per process."""
+    global _checkpoint_conn
+    if _checkpoint_conn is None:
+        _checkpoint_conn = duckdb.connect(CHECKPOINT_FILE)
+        atexit.register(_checkpoint_conn.close)
+    return _checkpoint_conn
 
 
 def initialize_checkpoint_db():
-    # Connect to DuckDB and create a table if it doesn't exist
-    conn = duckdb.connect(CHECKPOINT_FILE)
+    # Create the checkpoint table if it doesn't exist
+    conn = get_checkpoint_conn()
     conn.execute("""
         CREATE TABLE IF NOT EXISTS checkpoint (
             block_number INTEGER
@@ -50,22 +132,22 @@ def initialize_checkpoint_db():
     result = conn.execute("SELECT COUNT(*) FROM checkpoint").fetchone()[0]
     if result == 0:
         conn.execute("INSERT INTO checkpoint (block_number) VALUES (0)")
-    conn.close()
 
 
 def save_checkpoint(max_id):
-    # Save the new max_id, replacing the old value
-    conn = duckdb.connect(CHECKPOINT_FILE)
-    conn.execute("DELETE FROM checkpoint")  # Clear existing data
-    conn.execute("INSERT INTO checkpoint (block_number) VALUES (?)", (max_id,))
-    conn.close()
+    # Save the new max_id over the single checkpoint row
+    get_checkpoint_conn().execute(
+        "UPDATE checkpoint SET block_number = ?", (max_id,)
+    )
 
 
 def load_checkpoint():
     # Load the max_id, default to 0 if not found
-    conn = duckdb.connect(CHECKPOINT_FILE)
-    result = conn.execute("SELECT block_number FROM checkpoint").fetchone()
-    conn.close()
+    result = (
+        get_checkpoint_conn()
+        .execute("SELECT block_number FROM checkpoint")
+        .fetchone()
+    )
     return result[0] if result else None
 
 
@@ -74,124 +156,312 @@ def safe_hex_to_int(hex_str: Optional[str], default: Any = None) -> Optional[int
     return int(hex_str, 16) if hex_str is not None else default
 
 
+def get_parser() -> simdjson.Parser:
+    """Return the simdjson parser of the current thread, creating it on first use."""
+    if not hasattr(_thread_local, "parser"):
+        _thread_local.parser = simdjson.Parser()
+    return _thread_local.parser
+
+
 def fetch_latest_block_number(url: str, headers: Dict[str, str]) -> int:
     """Fetch the latest Ethereum block number from the Infura API."""
     payload = {"jsonrpc": "2.0", "method": "eth_blockNumber", "params": [], "id": 1}
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = session.post(url, data=orjson.dumps(payload), headers=headers)
+    # 429 is not retried by the session, wait for the rate limit to reset instead
+    while response.status_code == 429:
+        wait_for_rate_limit_reset(response)
+        response = session.post(url, data=orjson.dumps(payload), headers=headers)
     response.raise_for_status()  # Raise an exception for HTTP errors
-    data = response.json()
+    data = orjson.loads(response.content)
     if "result" not in data:
         raise ValueError("No 'result' in response: ", data)
     return safe_hex_to_int(data["result"])
 
 
-def fetch_block_data(
-    url: str, block_number_hex: str, headers: Dict[str, str]
-) -> Dict[str, Any]:
-    """Fetch block data by block number from the Infura API, including transactions."""
-    payload = {
-        "jsonrpc": "2.0",
-        "method": "eth_getBlockByNumber",
-        "params": [block_number_hex, True],  # True includes full transaction objects
-        "id": 1,
-    }
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+def fetch_blocks_batch(
+    url: str, block_numbers: List[int], headers: Dict[str, str]
+) -> List[simdjson.Object]:
+    """Fetch several blocks, including transactions, in one JSON-RPC batch call.
+
+    Blocks are returned in the order of block_numbers as lazy simdjson documents,
+    fields are only materialized when read.
+    """
+    payload = [
+        {
+            "jsonrpc": "2.0",
+            "method": "eth_getBlockByNumber",
+            "params": [hex(n), True],  # True includes full transaction objects
+            "id": i,
+        }
+        for i, n in enumerate(block_numbers)
+    ]
+    response = session.post(url, data=orjson.dumps(payload), headers=headers)
     response.raise_for_status()
-    data = response.json()
-    if "result" not in data:
-        raise ValueError("No 'result' in response: ", data)
-    return data["result"]
-
-
-def convert_transaction(tx: Dict[str, str]) -> Dict[str, Any]:
-    """Convert transaction data to a human-readable format."""
-    return {
-        "accessList": tx.get("accessList", []),
-        "blockHash": tx.get("blockHash"),
-        "blockNumber": safe_hex_to_int(tx.get("blockNumber")),
-        "chainId": safe_hex_to_int(tx.get("chainId")),
-        "from": tx["from"],
-        "gas": safe_hex_to_int(tx["gas"]),
-        "gasPrice": safe_hex_to_int(tx.get("gasPrice")),
-        "gasPrice_gwei": safe_hex_to_int(tx.get("gasPrice")) / 1e9
-        if tx.get("gasPrice")
-        else None,
-        "hash": tx["hash"],
-        "input": tx["input"],
-        "maxFeePerGas": safe_hex_to_int(tx.get("maxFeePerGas")),
-        "maxFeePerGas_gwei": safe_hex_to_int(tx.get("maxFeePerGas")) / 1e9
-        if tx.get("maxFeePerGas")
-        else None,
-        "maxPriorityFeePerGas": safe_hex_to_int(tx.get("maxPriorityFeePerGas")),
-        "maxPriorityFeePerGas_gwei": safe_hex_to_int(tx.get("maxPriorityFeePerGas"))
-        / 1e9
-        if tx.get("maxPriorityFeePerGas")
-        else None,
-        "nonce": safe_hex_to_int(tx["nonce"]),
-        "r": tx["r"],
-        "s": tx["s"],
-        "to": tx.get("to"),
-        "transactionIndex": safe_hex_to_int(tx.get("transactionIndex")),
-        "type": safe_hex_to_int(tx["type"]),
-        "v": safe_hex_to_int(tx["v"]),
-        "value": safe_hex_to_int(tx["value"]),
-        "value_eth": safe_hex_to_int(tx["value"]) / 1e18
-        if tx["value"] is not None
-        else None,
-        "yParity": safe_hex_to_int(tx.get("yParity")),
-    }
-
-
-def convert_block_data(block_data: Dict[str, str]) -> Dict[str, Any]:
+    data = get_parser().parse(response.content)
+    if not isinstance(data, simdjson.Array):
+        raise ValueError("Expected a batch response: ", data.as_dict())
+    # Batch responses may come back in any order
+    responses = {r["id"]: r for r in data}
+    blocks = []
+    for i, block_number in enumerate(block_numbers):
+        block_response = responses.get(i)
+        if block_response is None or "result" not in block_response:
+            raise ValueError(
+                f"No 'result' in response for block {block_number}: ",
+                block_response.as_dict() if block_response is not None else None,
+            )
+        blocks.append(block_response["result"])
+    return blocks
+
+
+def convert_transaction(
+    tx: simdjson.Object,
+    block_number: Optional[int] = None,
+    transaction_index: Optional[int] = None,
+) -> Tuple[Any, ...]:
+    """Convert transaction data to a row with values in TRANSACTION_SCHEMA order.
+
+    Rows are only ever turned into Arrow columns, so a tuple avoids building a
+    keyed dict per transaction. block_number and transaction_index can be passed
+    in when they are already known from the enclosing block, instead of being
+    parsed again for every transaction.
+    """
+    access_list = tx.get("accessList")
+    if block_number is None:
+        block_number = safe_hex_to_int(tx.get("blockNumber"))
+    if transaction_index is None:
+        transaction_index = safe_hex_to_int(tx.get("transactionIndex"))
+    # Fields every transaction carries are parsed with int() directly,
+    # safe_hex_to_int is only needed for the type specific ones
+    return (
+        access_list.as_list() if access_list is not None else [],  # accessList
+        tx.get("blockHash"),  # blockHash
+        block_number,  # blockNumber
+        safe_hex_to_int(tx.get("chainId")),  # chainId
+        tx["from"],  # from
+        int(tx["gas"], 16),  # gas
+        safe_hex_to_int(tx.get("gasPrice")),  # gasPrice
+        tx["hash"],  # hash
+        tx["input"],  # input
+        safe_hex_to_int(tx.get("maxFeePerGas")),  # maxFeePerGas
+        safe_hex_to_int(tx.get("maxPriorityFeePerGas")),  # maxPriorityFeePerGas
+        int(tx["nonce"], 16),  # nonce
+        tx["r"],  # r
+        tx["s"],  # s
+        tx.get("to"),  # to
+        transaction_index,  # transactionIndex
+        int(tx["type"], 16),  # type
+        int(tx["v"], 16),  # v
+        int(tx["value"], 16),  # value
+        safe_hex_to_int(tx.get("yParity")),  # yParity
+    )
+
+
+def convert_legacy_transaction(
+    tx: simdjson.Object, block_number: int, transaction_index: int
+) -> Tuple[Any, ...]:
+    """Convert a legacy (type 0x0) transaction, which has no EIP-2930/1559 fields."""
+    return (
+        [],  # accessList
+        tx["blockHash"],  # blockHash
+        block_number,  # blockNumber
+        safe_hex_to_int(tx.get("chainId")),  # chainId, absent before EIP-155
+        tx["from"],  # from
+        int(tx["gas"], 16),  # gas
+        int(tx["gasPrice"], 16),  # gasPrice
+        tx["hash"],  # hash
+        tx["input"],  # input
+        None,  # maxFeePerGas
+        None,  # maxPriorityFeePerGas
+        int(tx["nonce"], 16),  # nonce
+        tx["r"],  # r
+        tx["s"],  # s
+        tx.get("to"),  # to
+        transaction_index,  # transactionIndex
+        0,  # type
+        int(tx["v"], 16),  # v
+        int(tx["value"], 16),  # value
+        None,  # yParity
+    )
+
+
+def convert_dynamic_fee_transaction(
+    tx: simdjson.Object, block_number: int, transaction_index: int
+) -> Tuple[Any, ...]:
+    """Convert an EIP-1559 style (type 0x2 and later) transaction.
+
+    These always carry the chain id and fee cap fields, so those are read directly.
+    accessList and yParity are still guarded, as some nodes omit them.
+    """
+    access_list = tx.get("accessList")
+    return (
+        access_list.as_list() if access_list is not None else [],  # accessList
+        tx["blockHash"],  # blockHash
+        block_number,  # blockNumber
+        int(tx["chainId"], 16),  # chainId
+        tx["from"],  # from
+        int(tx["gas"], 16),  # gas
+        int(tx["gasPrice"], 16),  # gasPrice
+        tx["hash"],  # hash
+        tx["input"],  # input
+        int(tx["maxFeePerGas"], 16),  # maxFeePerGas
+        int(tx["maxPriorityFeePerGas"], 16),  # maxPriorityFeePerGas
+        int(tx["nonce"], 16),  # nonce
+        tx["r"],  # r
+        tx["s"],  # s
+        tx.get("to"),  # to
+        transaction_index,  # transactionIndex
+        int(tx["type"], 16),  # type
+        int(tx["v"], 16),  # v
+        int(tx["value"], 16),  # value
+        safe_hex_to_int(tx.get("yParity")),  # yParity
+    )
+
+
+# Converters specialized on the raw transaction type, other types use the
+# generic convert_transaction
+TRANSACTION_CONVERTERS = {
+    "0x0": convert_legacy_transaction,
+    "0x2": convert_dynamic_fee_transaction,  # EIP-1559
+    "0x3": convert_dynamic_fee_transaction,  # EIP-4844 blob
+    "0x4": convert_dynamic_fee_transaction,  # EIP-7702 set code
+}
+
+
+def convert_block_data(block_data: simdjson.Object) -> Dict[str, Any]:
     """Convert block data to a human-readable format."""
-    logging.info(block_data.keys())
+    number = int(block_data["number"], 16)
     return {
-        "baseFeePerGas": safe_hex_to_int(block_data["baseFeePerGas"]),
-        "baseFeePerGas_gwei": safe_hex_to_int(block_data["baseFeePerGas"]) / 1e9,
-        "blobGasUsed": safe_hex_to_int(block_data["blobGasUsed"]),
-        "difficulty": safe_hex_to_int(block_data["difficulty"]),
-        "excessBlobGas": safe_hex_to_int(block_data["excessBlobGas"]),
-        "extraData": bytes.fromhex(block_data["extraData"][2:]).decode(
-            "ascii", errors="ignore"
-        ),
-        "gasLimit": safe_hex_to_int(block_data["gasLimit"]),
-        "gasUsed": safe_hex_to_int(block_data["gasUsed"]),
+        "baseFeePerGas": int(block_data["baseFeePerGas"], 16),
+        "blobGasUsed": int(block_data["blobGasUsed"], 16),
+        "difficulty": int(block_data["difficulty"], 16),
+        "excessBlobGas": int(block_data["excessBlobGas"], 16),
+        "extraData": block_data["extraData"],
+        "gasLimit": int(block_data["gasLimit"], 16),
+        "gasUsed": int(block_data["gasUsed"], 16),
         "hash": block_data["hash"],
         "logsBloom": block_data["logsBloom"],
         "miner": block_data["miner"],
         "mixHash": block_data["mixHash"],
-        "nonce": safe_hex_to_int(block_data["nonce"]),
-        "number": safe_hex_to_int(block_data["number"]),
+        "nonce": int(block_data["nonce"], 16),
+        "number": number,
         "parentBeaconBlockRoot": block_data["parentBeaconBlockRoot"],
         "parentHash": block_data["parentHash"],
         "receiptsRoot": block_data["receiptsRoot"],
         "sha3Uncles": block_data["sha3Uncles"],
-        "size": safe_hex_to_int(block_data["size"]),
+        "size": int(block_data["size"], 16),
         "stateRoot": block_data["stateRoot"],
-        "timestamp": safe_hex_to_int(block_data["timestamp"]),
-        "timestamp_readable": datetime.fromtimestamp(
-            safe_hex_to_int(block_data["timestamp"]), tz=timezone.utc
-        ).strftime("%Y-%m-%d %H:%M:%S UTC"),
-        "transactions": [convert_transaction(tx) for tx in block_data["transactions"]],
+        "timestamp": int(block_data["timestamp"], 16),
+        # Transactions are listed in block order, so their position is their index
+        "transactions": [
+            TRANSACTION_CONVERTERS.get(tx["type"], convert_transaction)(
+                tx, number, index
+            )
+            for index, tx in enumerate(block_data["transactions"])
+        ],
     }
 
 
-def save_to_json(data: Dict[str, Any], file_path: str = "data.json") -> None:
-    """Save data to a JSON file with indentation."""
+def fetch_readable_blocks(url: str, block_numbers: List[int]) -> List[Dict[str, Any]]:
+    """Fetch a batch of blocks and convert them before their document is released."""
+    logger.info("Getting blocks %d to %d", block_numbers[0], block_numbers[-1])
+    return [
+        convert_block_data(block_data)
+        for block_data in fetch_blocks_batch(url, block_numbers, HEADERS)
+    ]
+
+
+def wait_for_rate_limit_reset(response: requests.Response) -> None:
+    """Sleep until the Infura rate limit window resets, 60 seconds if unknown."""
+    reset_time_str = response.headers.get("X-RateLimit-Reset")
+    wait_time = int(reset_time_str) - int(time.time()) if reset_time_str else 60
+    if wait_time > 0:
+        logger.info("Rate limit hit, waiting %d seconds...", wait_time)
+        time.sleep(wait_time)
+
+
+def fetch_blocks(
+    pool: ThreadPoolExecutor, url: str, block_numbers: Iterable[int]
+) -> List[Dict[str, Any]]:
+    """Fetch and convert a window of blocks as concurrent batches, in block order.
+
+    When Infura rate limits the window, the in-flight requests are drained and
+    only the missing batches are requested again once the limit resets.
+    """
+    readable_blocks = {}
+    pending = list(block_numbers)
+    while pending:
+        futures = {}
+        for i in range(0, len(pending), BATCH_SIZE):
+            batch = pending[i : i + BATCH_SIZE]
+            futures[tuple(batch)] = pool.submit(fetch_readable_blocks, url, batch)
+        wait(futures.values())
+        rate_limited_response = None
+        for batch, future in futures.items():
+            try:
+                readable_blocks.update(zip(batch, future.result()))
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 429:
+                    raise
+                rate_limited_response = e.response
+        pending = [n for n in pending if n not in readable_blocks]
+        if rate_limited_response is not None:
+            wait_for_rate_limit_reset(rate_limited_response)
+    return [readable_blocks[n] for n in block_numbers]
+
+
+def rows_to_batch(rows: List[Tuple[Any, ...]], schema: pa.Schema) -> pa.RecordBatch:
+    """Build a record batch from tuple rows laid out in schema order."""
+    columns = list(zip(*rows)) or [()] * len(schema)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+def create_output_table(
+    conn: duckdb.DuckDBPyConnection, table: str, schema: pa.Schema
+) -> None:
+    """Create an empty staging table with the column types of an Arrow schema."""
+    conn.register("empty_batch", schema.empty_table())
+    conn.execute(f"CREATE TABLE {table} AS SELECT * FROM empty_batch")
+    conn.unregister("empty_batch")
+
+
+def append_batch(
+    conn: duckdb.DuckDBPyConnection, table: str, batch: pa.RecordBatch
+) -> None:
+    """Append a record batch to a staging table."""
+    conn.register("batch", batch)
+    conn.execute(f"INSERT INTO {table} SELECT * FROM batch")
+    conn.unregister("batch")
+
+
+def save_to_parquet(
+    conn: duckdb.DuckDBPyConnection, table: str, file_path: str
+) -> None:
+    """Copy a staging table to a zstd compressed Parquet file, then empty it."""
     directory = os.path.dirname(file_path)
     if not os.path.exists(directory):
-        logging.info("Drirectory does not exist, created new!")
+        logger.info("Drirectory does not exist, created new!")
         os.makedirs(directory, exist_ok=True)
 
-    with open(file_path, "w") as file:
-        json.dump(data, file, indent=4)
+    conn.execute(
+        f"COPY {table} TO '{file_path}' "
+        "(FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE 100000)"
+    )
+    conn.execute(f"DELETE FROM {table}")
 
 
 def main():
     try:
         job_start_time = datetime.now().strftime("%Y_%m_%d__%H_%M_%S")
-        blocks_data = []
-        transactions_data = []
+        # Rows are staged in in-memory DuckDB tables until they are copied to Parquet
+        output_conn = duckdb.connect(":memory:")
+        create_output_table(output_conn, "blocks", BLOCK_SCHEMA)
+        create_output_table(output_conn, "transactions", TRANSACTION_SCHEMA)
+        blocks_size = 0
+        transactions_size = 0
         blocks_file_index = 1
         transactions_file_index = 1
 
@@ -202,73 +472,95 @@ def main():
 
         latest_block_number = fetch_latest_block_number(url, HEADERS)
         previous_block_number = load_checkpoint()
-        logging.info(f"Previous block number: {previous_block_number}")
-        logging.info(f"Latest block number: {latest_block_number}")
+        logger.info("Previous block number: %s", previous_block_number)
+        logger.info("Latest block number: %d", latest_block_number)
         if not previous_block_number:
-            logging.info(
+            logger.info(
                 "No checkpoint found!\n Getting data from latest block instead."
             )
             current_block_number = latest_block_number
         else:
             current_block_number = previous_block_number + 1
 
-        while current_block_number <= latest_block_number:
-            logging.info(f"Getting block {current_block_number}")
-            block_data = fetch_block_data(url, hex(current_block_number), HEADERS)
-            readable_data = convert_block_data(block_data)
-
-            # Append transactions and block data
-            transactions_data.extend(readable_data["transactions"])
-            del readable_data["transactions"]
-            blocks_data.append(readable_data)  # Changed to append single block
-
-            # Check sizes and save if necessary
-            blocks_size = get_size(blocks_data)
-            transactions_size = get_size(transactions_data)
-
-            if blocks_size >= MAX_SIZE_BYTES:
-                save_to_json(blocks_data, f"blocks_{blocks_file_index}.json")
-                logging.info(
-                    f"Saved blocks_{blocks_file_index}.json ({blocks_size / (1024 * 1024):.2f} MB)"
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            while current_block_number <= latest_block_number:
+                block_numbers = range(
+                    current_block_number,
+                    min(
+                        current_block_number + FETCH_WORKERS * BATCH_SIZE,
+                        latest_block_number + 1,
+                    ),
                 )
-                blocks_data = []
-                blocks_file_index += 1
-
-            if transactions_size >= MAX_SIZE_BYTES:
-                save_to_json(
-                    transactions_data, f"transactions_{transactions_file_index}.json"
-                )
-                logging.info(
-                    f"Saved transactions_{transactions_file_index}.json ({transactions_size / (1024 * 1024):.2f} MB)"
+                readable_blocks = fetch_blocks(pool, url, block_numbers)
+                transactions = [
+                    tx for block in readable_blocks for tx in block.pop("transactions")
+                ]
+
+                # Hand each window over as columns rather than one dict per record
+                blocks_batch = pa.RecordBatch.from_pylist(
+                    readable_blocks, schema=BLOCK_SCHEMA
                 )
-                transactions_data = []
-                transactions_file_index += 1
-
-            current_block_number += 1
+                append_batch(output_conn, "blocks", blocks_batch)
+                blocks_size += blocks_batch.nbytes
+                transactions_batch = rows_to_batch(transactions, TRANSACTION_SCHEMA)
+                append_batch(output_conn, "transactions", transactions_batch)
+                transactions_size += transactions_batch.nbytes
+
+                if blocks_size >= MAX_SIZE_BYTES:
+                    save_to_parquet(
+                        output_conn,
+                        "blocks",
+                        f"./output/{job_start_time}/blocks_{blocks_file_index}.parquet",
+                    )
+                    logger.info(
+                        "Saved blocks_%d.parquet (%.2f MB)",
+                        blocks_file_index,
+                        blocks_size / (1024 * 1024),
+                    )
+                    blocks_size = 0
+                    blocks_file_index += 1
+
+                if transactions_size >= MAX_SIZE_BYTES:
+                    save_to_parquet(
+                        output_conn,
+                        "transactions",
+                        f"./output/{job_start_time}/transactions_{transactions_file_index}.parquet",
+                    )
+                    logger.info(
+                        "Saved transactions_%d.parquet (%.2f MB)",
+                        transactions_file_index,
+                        transactions_size / (1024 * 1024),
+                    )
+                    transactions_size = 0
+                    transactions_file_index += 1
+
+                current_block_number = block_numbers.stop
 
         # Save any remaining data
-        if blocks_data:
-            save_to_json(
-                blocks_data,
-                f"./output/{job_start_time}/blocks_{blocks_file_index}.json",
+        if output_conn.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]:
+            save_to_parquet(
+                output_conn,
+                "blocks",
+                f"./output/{job_start_time}/blocks_{blocks_file_index}.parquet",
             )
-            logging.info(f"Saved blocks_{blocks_file_index}.json")
-        if transactions_data:
-            save_to_json(
-                transactions_data,
-                f"./output/{job_start_time}/transactions_{transactions_file_index}.json",
+            logger.info("Saved blocks_%d.parquet", blocks_file_index)
+        if output_conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]:
+            save_to_parquet(
+                output_conn,
+                "transactions",
+                f"./output/{job_start_time}/transactions_{transactions_file_index}.parquet",
             )
-            logging.info(f"Saved transactions_{transactions_file_index}.json")
+            logger.info("Saved transactions_%d.parquet", transactions_file_index)
 
         save_checkpoint(latest_block_number)
-        logging.info("Checkpoint updated")
+        logger.info("Checkpoint updated")
 
     except requests.RequestException as e:
-        logging.info(f"Error fetching data from Infura: {e}")
+        logger.info("Error fetching data from Infura: %s", e)
     except ValueError as e:
-        logging.info(f"Error processing response: {e}")
+        logger.info("Error processing response: %s", e)
     except Exception as e:
-        logging.info(f"Unexpected error: {e}")
+        logger.info("Unexpected error: %s", e)
 
 
 if __name__ == "__main__":
@@ -1,55 +1,67 @@
 import json
+import orjson
 import boto3
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 import requests
 from requests.adapters import HTTPAdapter, Retry
+from requests.exceptions import HTTPError, RequestException
 import os
-from typing import Dict, Any, Optional
-import sys
+import time
+from typing import Dict, Any, Iterable, List, Optional
 import logging
+import zstandard as zstd
 
 # import requests
 
 
+# CloudWatch ingestion is billed, so only warnings and errors are logged unless LOG_LEVEL says otherwise
+logger = logging.getLogger(__name__)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
+logger.setLevel(LOG_LEVEL if LOG_LEVEL in logging.getLevelNamesMapping() else logging.WARNING)
 s3 = boto3.client('s3')
-ssm = boto3.client('ssm')
-BUCKET = ssm.get_parameter(Name='/infura_integration/bucket')['Parameter']['Value']
-INFURA_KEY = ssm.get_parameter(Name='/infura_integration/infura_key', WithDecryption=True)['Parameter']['Value']
+def get_setting(env_var: str, parameter_name: str, with_decryption: bool = False) -> str:
+    """Read a setting from the Lambda environment, falling back to SSM Parameter Store."""
+    value = os.environ.get(env_var)
+    if value is None:
+        ssm = boto3.client('ssm')
+        value = ssm.get_parameter(Name=parameter_name, WithDecryption=with_decryption)['Parameter']['Value']
+    return value
+# Resolved once per container, warm invocations reuse them
+BUCKET = get_setting('BUCKET', '/infura_integration/bucket')
+INFURA_KEY = get_setting('INFURA_KEY', '/infura_integration/infura_key', with_decryption=True)
 KEY = "last_block.json"
+BLOCKS_TMP_PATH = "/tmp/blocks.ndjson.zst"  # Local buffer for the file being written
 HEADERS = {"Content-Type": "application/json"}
 INFURA_URL = "https://mainnet.infura.io/v3/" 
-MAX_SIZE_BYTES = 20 * 1024 * 1024  # 50 MB in bytes
+MAX_SIZE_BYTES = 20 * 1024 * 1024  # 20 MB of NDJSON, measured before compression
+BATCH_SIZE = 50  # Blocks requested per JSON-RPC batch call
+FETCH_WORKERS = 4  # Number of batch calls in flight at once
+cctx = zstd.ZstdCompressor(level=3, threads=-1)
+# Compressed files are only 4-7 MB, so use S3's 5 MB minimum part size to get them uploaded as parallel parts
+transfer_config = TransferConfig(multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024, max_concurrency=10, use_threads=True)
 s = requests.Session()
-retries = Retry(total=5, backoff_factor=1, status_forcelist=[502, 503, 504, 429])
-s.mount('https://', HTTPAdapter(max_retries=retries))
+# Every JSON-RPC call is a read-only POST, so 5xx responses are safe to retry for any method.
+# 429 is left to the callers, which wait until the limit resets
+retries = Retry(total=5, backoff_factor=1, status_forcelist=[502, 503, 504], allowed_methods=None)
+s.mount('https://', HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS, max_retries=retries))
 def get_last_block() -> int:
     try:
         obj = s3.get_object(Bucket=BUCKET, Key=KEY)
-        return json.loads(obj['Body'].read())['last_block']
+        return orjson.loads(obj['Body'].read())['last_block']
     except s3.exceptions.NoSuchKey:
         return None
 def save_last_block(block_number: int):
-    s3.put_object(Bucket=BUCKET, Key=KEY, Body=json.dumps({'last_block': block_number}))
+    s3.put_object(Bucket=BUCKET, Key=KEY, Body=orjson.dumps({'last_block': block_number}))
     
-def save_blocks_data(block_data: dict, file_name):
-    s3.put_object(Bucket=BUCKET, Key=file_name, Body=json.dumps(block_data))
-    
-def get_size(obj, seen=None):
-    """Recursively calculate the size of an object in bytes."""
-    if seen is None:
-        seen = set()
-    obj_id = id(obj)
-    if obj_id in seen:
-        return 0
-    seen.add(obj_id)
-
-    size = sys.getsizeof(obj)
-    if isinstance(obj, dict):
-        size += sum(get_size(k, seen) + get_size(v, seen) for k, v in obj.items())
-    elif isinstance(obj, (list, tuple, set)):
-        size += sum(get_size(item, seen) for item in obj)
-    return size
+def open_blocks_file():
+    """Open the local buffer file, compressing everything written to it with zstd."""
+    return cctx.stream_writer(open(BLOCKS_TMP_PATH, "wb"))
 
+def save_blocks_data(file_path: str, file_name):
+    s3.upload_file(file_path, BUCKET, file_name, Config=transfer_config)
+    
 def safe_hex_to_int(hex_str: Optional[str], default: Any = None) -> Optional[int]:
     """Safely convert a hex string to an integer, returning default if None."""
     return int(hex_str, 16) if hex_str is not None else default
@@ -57,98 +69,136 @@ def safe_hex_to_int(hex_str: Optional[str], default: Any = None) -> Optional[int
 def fetch_latest_block_number(url: str, headers: Dict[str, str]) -> int:
     """Fetch the latest Ethereum block number from the Infura API."""
     payload = {"jsonrpc": "2.0", "method": "eth_blockNumber", "params": [], "id": 1}
-    response = s.post(url, data=json.dumps(payload), headers=headers)
+    response = s.post(url, data=orjson.dumps(payload), headers=headers)
+    # 429 is not retried by the session, wait for the rate limit to reset instead
+    while response.status_code == 429:
+        wait_for_rate_limit_reset(response)
+        response = s.post(url, data=orjson.dumps(payload), headers=headers)
     response.raise_for_status()  # Raise an exception for HTTP errors
-    data = response.json()
+    data = orjson.loads(response.content)
     if "result" not in data:
         raise ValueError("No 'result' in response: ", data)
     return safe_hex_to_int(data["result"])
 
-def fetch_block_data_with_rate_limit_retry(url, block_number_hex, headers, session):
-    while True:
-        try:
-            return fetch_block_data(url, block_number_hex, headers)
-        except HTTPError as e:
-            if e.response.status_code == 429:
-                reset_time_str = e.response.headers.get('X-RateLimit-Reset')
-                if reset_time_str:
-                    reset_time = int(reset_time_str)
-                    current_time = int(time.time())
-                    wait_time = reset_time - current_time
-                    if wait_time > 0:
-                        logging.info(f"Rate limit reset in {wait_time} seconds. Waiting...")
-                        time.sleep(wait_time)
-                    continue
-                else:
-                    logging.info("Rate limit hit, waiting 60 seconds...")
-                    time.sleep(60)
-                    continue
-            else:
-                raise
-        except Exception as e:
-            logging.error(f"Unexpected error: {e}")
-            raise
+def wait_for_rate_limit_reset(response: requests.Response):
+    reset_time_str = response.headers.get('X-RateLimit-Reset')
+    if reset_time_str:
+        wait_time = int(reset_time_str) - int(time.time())
+        if wait_time > 0:
+            logger.info("Rate limit reset in %d seconds. Waiting...", wait_time)
+            time.sleep(wait_time)
+    else:
+        logger.info("Rate limit hit, waiting 60 seconds...")
+        time.sleep(60)
 
-def fetch_block_data(
-    url: str, block_number_hex: str, headers: Dict[str, str]
-) -> Dict[str, Any]:
-    """Fetch block data by block number from the Infura API, including transactions."""
-    payload = {
-        "jsonrpc": "2.0",
-        "method": "eth_getBlockByNumber",
-        "params": [block_number_hex, True],  # True includes full transaction objects
-        "id": 1,
-    }
-    response = s.post(url, data=json.dumps(payload), headers=headers)
+def fetch_blocks_batch(
+    url: str, block_numbers: List[int], headers: Dict[str, str]
+) -> List[Dict[str, Any]]:
+    """Fetch several blocks, including transactions, in one JSON-RPC batch call, in block order."""
+    payload = [
+        {
+            "jsonrpc": "2.0",
+            "method": "eth_getBlockByNumber",
+            "params": [hex(n), True],  # True includes full transaction objects
+            "id": i,
+        }
+        for i, n in enumerate(block_numbers)
+    ]
+    response = s.post(url, data=orjson.dumps(payload), headers=headers)
     response.raise_for_status()
-    data = response.json()
-    if "result" not in data:
-        raise ValueError("No 'result' in response: ", data)
-    return data["result"]
-
+    data = orjson.loads(response.content)
+    if not isinstance(data, list):
+        raise ValueError("Expected a batch response: ", data)
+    # Batch responses may come back in any order
+    responses = {r["id"]: r for r in data}
+    blocks = []
+    for i, block_number in enumerate(block_numbers):
+        block_response = responses.get(i)
+        if block_response is None or "result" not in block_response:
+            raise ValueError(f"No 'result' in response for block {block_number}: ", block_response)
+        blocks.append(block_response["result"])
+    return blocks
 
+def fetch_blocks(pool: ThreadPoolExecutor, url: str, block_numbers: Iterable[int]) -> List[Dict[str, Any]]:
+    """Fetch a window of blocks as concurrent batches, in block order, retrying rate limited ones."""
+    blocks = {}
+    pending = list(block_numbers)
+    while pending:
+        futures = {}
+        for i in range(0, len(pending), BATCH_SIZE):
+            batch = pending[i:i + BATCH_SIZE]
+            logger.info("Getting blocks %d to %d", batch[0], batch[-1])
+            futures[tuple(batch)] = pool.submit(fetch_blocks_batch, url, batch, HEADERS)
+        # Drain the in-flight requests before backing off
+        wait(futures.values())
+        rate_limited_response = None
+        for batch, future in futures.items():
+            try:
+                blocks.update(zip(batch, future.result()))
+            except HTTPError as e:
+                if e.response is None or e.response.status_code != 429:
+                    raise
+                rate_limited_response = e.response
+        pending = [n for n in pending if n not in blocks]
+        if rate_limited_response is not None:
+            wait_for_rate_limit_reset(rate_limited_response)
+    return [blocks[n] for n in block_numbers]
 
 
 def lambda_handler(event, context):
     url = INFURA_URL + INFURA_KEY
-    blocks_data = []
-    transactions_data = []
+    # Blocks are streamed to disk as compressed NDJSON, one line per block, instead of kept in memory
+    blocks_file = open_blocks_file()
+    blocks_size = 0
     blocks_file_index = 1
     transactions_file_index = 1
     try:
         job_start_time = datetime.now().strftime("%Y_%m_%d__%H_%M_%S")
         previous_block_number = get_last_block()
         latest_block_number = fetch_latest_block_number(url, HEADERS)
-        logging.info(f"Previous block number: {previous_block_number}")
-        logging.info(f"Latest block number: {latest_block_number}")
+        logger.info("Previous block number: %s", previous_block_number)
+        logger.info("Latest block number: %d", latest_block_number)
         if not previous_block_number:
-            logging.info(
+            logger.info(
                 "No checkpoint found!\n Getting data from latest block instead."
             )
             current_block_number = latest_block_number
         else:
             current_block_number = previous_block_number + 1
 
-        while current_block_number <= latest_block_number:
-            logging.info(f"Getting block {current_block_number}")
-            block_data = fetch_block_data_with_rate_limit_retry(url, hex(current_block_number), HEADERS, s)
-            blocks_data.append(block_data)
-            blocks_size = get_size(blocks_data)
-            logging.info(f"Current block data size {blocks_size / (1024 * 1024):.2f} MB")
-            if blocks_size >= MAX_SIZE_BYTES:
-                file_name = f"blocks/blocks_{job_start_time}_{blocks_file_index}.json"
-                save_blocks_data(blocks_data, file_name)
-                logging.info(
-                    f"Saved blocks_{job_start_time}_{blocks_file_index}.json ({blocks_size / (1024 * 1024):.2f} MB)"
-                )
-                save_last_block(current_block_number)
-                blocks_data = []
-                blocks_file_index += 1
-            current_block_number += 1
+        window_size = FETCH_WORKERS * BATCH_SIZE
+        windows = [
+            range(start, min(start + window_size, latest_block_number + 1))
+            for start in range(current_block_number, latest_block_number + 1, window_size)
+        ]
+        # The next window is fetched in the background while the current one is written out
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool, ThreadPoolExecutor(max_workers=1) as prefetcher:
+            next_blocks = prefetcher.submit(fetch_blocks, pool, url, windows[0]) if windows else None
+            for i, block_numbers in enumerate(windows):
+                blocks = next_blocks.result()
+                if i + 1 < len(windows):
+                    next_blocks = prefetcher.submit(fetch_blocks, pool, url, windows[i + 1])
+                for block_number, block_data in zip(block_numbers, blocks):
+                    line = orjson.dumps(block_data, option=orjson.OPT_APPEND_NEWLINE)
+                    blocks_file.write(line)
+                    blocks_size += len(line)
+                    logger.debug("Current block data size %.2f MB", blocks_size / (1024 * 1024))
+                    if blocks_size >= MAX_SIZE_BYTES:
+                        blocks_file.close()
+                        file_name = f"blocks/blocks_{job_start_time}_{blocks_file_index}.ndjson.zst"
+                        save_blocks_data(BLOCKS_TMP_PATH, file_name)
+                        logger.info(
+                            "Saved blocks_%s_%d.ndjson.zst (%.2f MB)", job_start_time, blocks_file_index, blocks_size / (1024 * 1024)
+                        )
+                        save_last_block(block_number)
+                        blocks_file = open_blocks_file()
+                        blocks_size = 0
+                        blocks_file_index += 1
         # Save any remaining data
-        if blocks_data:
-            file_name = f"blocks/blocks_{job_start_time}_{blocks_file_index}.json"
-            save_blocks_data(blocks_data, file_name)
+        if blocks_size:
+            blocks_file.close()
+            file_name = f"blocks/blocks_{job_start_time}_{blocks_file_index}.ndjson.zst"
+            save_blocks_data(BLOCKS_TMP_PATH, file_name)
         save_last_block(latest_block_number)
         return {
             'statusCode': 200,
@@ -157,32 +207,34 @@ def lambda_handler(event, context):
     except HTTPError as e:
         status_code = e.response.status_code
         if status_code == 429:
-            logging.error(f"Rate limit exceeded: {e}")
+            logger.error("Rate limit exceeded: %s", e)
             return {
                 'statusCode': 429,
                 'body': json.dumps({'error': 'Rate limit exceeded', 'message': str(e)})
             }
         else:
-            logging.error(f"HTTP error {status_code}: {e}")
+            logger.error("HTTP error %d: %s", status_code, e)
             return {
                 'statusCode': status_code,
                 'body': json.dumps({'error': f'HTTP error {status_code}', 'message': str(e)})
             }
     except RequestException as e:
-        logging.error(f"Request error: {e}")
+        logger.error("Request error: %s", e)
         return {
             'statusCode': 500,
             'body': json.dumps({'error': 'Request error', 'message': str(e)})
         }
     except ValueError as e:
-        logging.error(f"Error processing response: {e}")
+        logger.error("Error processing response: %s", e)
         return {
             'statusCode': 500,
             'body': json.dumps({'error': 'Error processing response', 'message': str(e)})
         }
     except Exception as e:
-        logging.error(f"Unexpected error: {e}")
+        logger.error("Unexpected error: %s", e)
         return {
             'statusCode': 500,
             'body': json.dumps({'error': 'Unexpected error', 'message': str(e)})
-    }
\ No newline at end of file
+    }
+    finally:
+        blocks_file.close()
\ No newline at end of file
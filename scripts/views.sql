@@ -0,0 +1,29 @@
+-- Human-readable columns derived on read from the Parquet output of data_retrieval.py,
+-- instead of being computed and stored for every record.
+-- Run from the directory data_retrieval.py writes ./output to.
+
+CREATE OR REPLACE VIEW blocks AS
+SELECT
+    *,
+    to_timestamp(timestamp::DOUBLE) AS timestamp_readable,
+    baseFeePerGas / 1e9 AS baseFeePerGas_gwei,
+    -- Printable ASCII of the raw extraData hex, non-printable bytes are dropped.
+    -- The BLOB cast writes those as \xNN escapes, and also escapes the printable
+    -- ", ' and \ bytes, which are turned back into characters afterwards.
+    replace(replace(replace(
+        regexp_replace(
+            unhex(substr(extraData, 3))::VARCHAR,
+            '\\x([01][0-9A-F]|7F|[89A-F][0-9A-F])', '', 'g'
+        ),
+        '\x22', '"'), '\x27', ''''), '\x5C', '\'
+    ) AS extraData_text
+FROM read_parquet('output/*/blocks_*.parquet');
+
+CREATE OR REPLACE VIEW transactions AS
+SELECT
+    *,
+    gasPrice / 1e9 AS gasPrice_gwei,
+    maxFeePerGas / 1e9 AS maxFeePerGas_gwei,
+    maxPriorityFeePerGas / 1e9 AS maxPriorityFeePerGas_gwei,
+    value / 1e18 AS value_eth
+FROM read_parquet('output/*/transactions_*.parquet');
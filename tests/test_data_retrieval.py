@@ -0,0 +1,202 @@
+import importlib.util
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+import pytest
+import requests
+import simdjson
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), "..", "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+
+import data_retrieval  # noqa: E402
+from data_retrieval import (  # noqa: E402
+    TRANSACTION_CONVERTERS,
+    convert_transaction,
+)
+
+LEGACY_TX = {
+    "blockHash": "0x8e38b4dbf6b11fcc3b9dee84fb7986e29ca0a02cecd8977c161ff7333329681e",
+    "blockNumber": "0xf4240",
+    "from": "0x39fa8c5f2793459d6622857e7d9fbb4bd91766d3",
+    "gas": "0x1f8dc",
+    "gasPrice": "0x12bfb19e60",
+    "hash": "0xea1093d492a1dcb1bef708f771a99a96ff05dcab81ca76c31940300177fcf49f",
+    "input": "0x",
+    "nonce": "0x15",
+    "r": "0xa254fe085f721c2abe00a2cd244110bfc0df5f4f25461c85d8ab75ebac11eb10",
+    "s": "0x30b7835ba481955b20193a703ebc5fdffeab081d63117199040cdf5a91c68765",
+    "to": "0xc083e9947cf02b8ffc7d3090ae9aea72df98fd47",
+    "transactionIndex": "0x0",
+    "type": "0x0",
+    "v": "0x1c",
+    "value": "0x56bc75e2d63100000",
+}
+
+DYNAMIC_FEE_TX = {
+    "accessList": [
+        {
+            "address": "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2",
+            "storageKeys": [
+                "0x0000000000000000000000000000000000000000000000000000000000000003"
+            ],
+        }
+    ],
+    "blockHash": "0x8e38b4dbf6b11fcc3b9dee84fb7986e29ca0a02cecd8977c161ff7333329681e",
+    "blockNumber": "0x1406f40",
+    "chainId": "0x1",
+    "from": "0x95222290dd7278aa3ddd389cc1e1d165cc4bafe5",
+    "gas": "0x5208",
+    "gasPrice": "0x2c3ba4d54",
+    "hash": "0x1c7b4a2bd0b7a3c1f06e5d9cc1c86fdf1e1c4d4bb3e7e8b4c1a0d3c1f8f0b1a2",
+    "input": "0xa9059cbb",
+    "maxFeePerGas": "0x2c3ba4d54",
+    "maxPriorityFeePerGas": "0x0",
+    "nonce": "0x10c1f",
+    "r": "0x5a3f7c6e2b1f0a9d8c7b6a5f4e3d2c1b0a9f8e7d6c5b4a3f2e1d0c9b8a7f6e5d",
+    "s": "0x1b2c3d4e5f6a7b8c9d0e1f2a3b4c5d6e7f8a9b0c1d2e3f4a5b6c7d8e9f0a1b2c",
+    "to": "0x388c818ca8b9251b393131c08a736a67ccb19297",
+    "transactionIndex": "0x7",
+    "type": "0x2",
+    "v": "0x1",
+    "value": "0xde0b6b3a7640000",
+    "yParity": "0x1",
+}
+
+# Some nodes leave out accessList and yParity on typed transactions
+DYNAMIC_FEE_TX_WITHOUT_OPTIONAL = {
+    k: v for k, v in DYNAMIC_FEE_TX.items() if k not in ("accessList", "yParity")
+}
+
+
+@pytest.mark.parametrize(
+    "tx",
+    [LEGACY_TX, DYNAMIC_FEE_TX, DYNAMIC_FEE_TX_WITHOUT_OPTIONAL],
+    ids=["legacy", "dynamic_fee", "dynamic_fee_without_optional"],
+)
+def test_specialized_converter_matches_generic(tx):
+    parsed = simdjson.Parser().parse(orjson.dumps(tx))
+    block_number = int(tx["blockNumber"], 16)
+    transaction_index = int(tx["transactionIndex"], 16)
+
+    specialized = TRANSACTION_CONVERTERS[tx["type"]](
+        parsed, block_number, transaction_index
+    )
+
+    assert specialized == convert_transaction(parsed)
+
+
+def make_block(number):
+    return {
+        "baseFeePerGas": "0x3b9aca00",
+        "blobGasUsed": "0x0",
+        "difficulty": "0x0",
+        "excessBlobGas": "0x0",
+        "extraData": "0x",
+        "gasLimit": "0x1c9c380",
+        "gasUsed": "0x0",
+        "hash": hex(number),
+        "logsBloom": "0x00",
+        "miner": "0x0",
+        "mixHash": "0x0",
+        "nonce": "0x0000000000000000",
+        "number": hex(number),
+        "parentBeaconBlockRoot": "0x0",
+        "parentHash": hex(number - 1),
+        "receiptsRoot": "0x0",
+        "sha3Uncles": "0x0",
+        "size": "0x100",
+        "stateRoot": "0x0",
+        "timestamp": "0x67000000",
+        "transactions": [],
+        "withdrawals": [],
+    }
+
+
+class FakeInfura:
+    """Answers batch calls in reverse order and rate limits one batch once."""
+
+    def __init__(self, rate_limited_block):
+        self.rate_limited_block = rate_limited_block
+        self.requested = []
+
+    def post(self, url, data, headers):
+        calls = orjson.loads(data)
+        block_numbers = [int(call["params"][0], 16) for call in calls]
+        self.requested.append(block_numbers)
+        response = requests.Response()
+        response.url = url
+        if self.rate_limited_block in block_numbers:
+            self.rate_limited_block = None
+            response.status_code = 429
+            response.reason = "Too Many Requests"
+            response.headers["X-RateLimit-Reset"] = "0"
+            response._content = b""
+            return response
+        response.status_code = 200
+        response._content = orjson.dumps(
+            [
+                {"jsonrpc": "2.0", "id": call["id"], "result": make_block(n)}
+                for call, n in reversed(list(zip(calls, block_numbers)))
+            ]
+        )
+        return response
+
+
+def test_fetch_blocks_retries_rate_limited_batch_in_order(monkeypatch):
+    infura = FakeInfura(rate_limited_block=13)
+    monkeypatch.setattr(data_retrieval.session, "post", infura.post)
+    monkeypatch.setattr(data_retrieval, "BATCH_SIZE", 2)
+    block_numbers = list(range(10, 16))
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        blocks = data_retrieval.fetch_blocks(pool, "https://infura.test", block_numbers)
+
+    assert [block["number"] for block in blocks] == block_numbers
+    # Only the rate limited batch is requested a second time
+    assert sorted(map(tuple, infura.requested)) == [
+        (10, 11),
+        (12, 13),
+        (12, 13),
+        (14, 15),
+    ]
+
+
+@pytest.fixture
+def lambda_app(monkeypatch):
+    pytest.importorskip("boto3")
+    pytest.importorskip("zstandard")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("BUCKET", "test-bucket")
+    monkeypatch.setenv("INFURA_KEY", "test-key")
+    spec = importlib.util.spec_from_file_location(
+        "infura_integration_app",
+        os.path.join(
+            SCRIPTS_DIR, "lambda", "infura-integration", "infura_integration", "app.py"
+        ),
+    )
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    return app
+
+
+def test_lambda_fetch_blocks_retries_rate_limited_batch_in_order(
+    monkeypatch, lambda_app
+):
+    infura = FakeInfura(rate_limited_block=13)
+    monkeypatch.setattr(lambda_app.s, "post", infura.post)
+    monkeypatch.setattr(lambda_app, "BATCH_SIZE", 2)
+    block_numbers = list(range(10, 16))
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        blocks = lambda_app.fetch_blocks(pool, "https://infura.test", block_numbers)
+
+    assert [int(block["number"], 16) for block in blocks] == block_numbers
+    assert sorted(map(tuple, infura.requested)) == [
+        (10, 11),
+        (12, 13),
+        (12, 13),
+        (14, 15),
+    ]